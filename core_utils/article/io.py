@@ -48,12 +48,12 @@ def to_meta(article: Article) -> None:
     """
     Saves metafile
     """
+    meta = json.dumps(article.get_meta(),
+                      indent=4,
+                      ensure_ascii=False,
+                      separators=(',', ': '))
     with open(article.get_meta_file_path(), 'w', encoding='utf-8') as meta_file:
-        json.dump(article.get_meta(),
-                  meta_file,
-                  indent=4,
-                  ensure_ascii=False,
-                  separators=(',', ': '))
+        meta_file.write(meta)
 
 
 def from_meta(path: Union[Path, str],
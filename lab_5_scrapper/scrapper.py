@@ -1,16 +1,27 @@
 """
 Crawler implementation
 """
+import argparse
 import datetime
-import json
+import itertools
 import re
 import shutil
+import tempfile
+import threading
 import urllib.parse
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from html import unescape
 from pathlib import Path
-from typing import Union
+from typing import Any, Iterator, Optional, Union
 
+import ciso8601
+import orjson
 import requests
-from bs4 import BeautifulSoup
+import requests_cache
+from lxml import etree, html
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from core_utils.article.article import Article
 from core_utils.article.io import to_meta, to_raw
@@ -19,6 +30,27 @@ from core_utils.constants import (ASSETS_PATH, CRAWLER_CONFIG_PATH,
                                   NUM_ARTICLES_UPPER_LIMIT,
                                   TIMEOUT_LOWER_LIMIT, TIMEOUT_UPPER_LIMIT)
 
+HTTP_CACHE_PATH = ASSETS_PATH.parent / 'http_cache'
+HTTP_CACHE_EXPIRE_AFTER = 86400
+MAX_WORKERS = 20
+PAGES_PER_BATCH = 8
+POOL_SIZE = 32
+SEED_URL_PREFIXES = ('http://', 'https://')
+SITE_TIMEZONE = datetime.timezone(datetime.timedelta(hours=3))
+CARD_PATTERN = re.compile(r'<a\b[^>]*?\sclass=["\'][^"\']*(?<![\w-])card(?![\w-])[^>]*>',
+                          re.IGNORECASE)
+HREF_PATTERN = re.compile(r'\shref=["\']([^"\']*)["\']', re.IGNORECASE)
+HAS_CLASS = 'contains(concat(" ", normalize-space(@class), " "), " {} ")'
+PARAGRAPHS_XPATH = etree.XPath('//p')
+TITLE_XPATH = etree.XPath(f'string((//h1[{HAS_CLASS.format("material__name")}])[1])',
+                          smart_strings=False)
+AUTHOR_XPATH = etree.XPath(f'string((//span[{HAS_CLASS.format("material__autor")}])[1])',
+                           smart_strings=False)
+DATE_XPATH = etree.XPath('string((//span[@itemprop="datePublished"])[1])',
+                         smart_strings=False)
+TOPICS_XPATH = etree.XPath(f'(//div[{HAS_CLASS.format("hashtags")}])[1]//a')
+PARSER_WORKER_STATE: dict[str, 'Config'] = {}
+
 
 class IncorrectSeedURLError(Exception):
     """
@@ -66,13 +98,13 @@ class Config:
     """
     Unpacks and validates configurations
     """
-    def __init__(self, path_to_config: Path) -> None:
+    def __init__(self, path_to_config: Path, cache_path: Optional[Path] = None) -> None:
         """
         Initializes an instance of the Config class
         """
         self.path_to_config = path_to_config
-        self._validate_config_content()
         config_dto = self._extract_config_content()
+        self._validate_config_content(config_dto)
         self._seed_urls = config_dto.seed_urls
         self._num_articles = config_dto.total_articles
         self._headers = config_dto.headers
@@ -80,13 +112,16 @@ class Config:
         self._timeout = config_dto.timeout
         self._should_verify_certificate = config_dto.should_verify_certificate
         self._headless_mode = config_dto.headless_mode
+        self._session = self._create_session(cache_path)
+        self._request_kwargs = {'headers': self._headers,
+                                'timeout': self._timeout,
+                                'verify': self._should_verify_certificate}
 
     def _extract_config_content(self) -> ConfigDTO:
         """
         Returns config values
         """
-        with open(self.path_to_config, 'r', encoding='utf-8') as f:
-            config = json.load(f)
+        config = orjson.loads(Path(self.path_to_config).read_bytes())
         return ConfigDTO(
             seed_urls=config['seed_urls'],
             total_articles_to_find_and_parse=config['total_articles_to_find_and_parse'],
@@ -97,18 +132,38 @@ class Config:
             headless_mode=config['headless_mode']
         )
 
-    def _validate_config_content(self) -> None:
+    @staticmethod
+    def _create_session(cache_path: Optional[Path]) -> requests.Session:
+        """
+        Creates a session reusing connections between requests,
+        caching responses on disk if cache path is given
+        """
+        session: requests.Session
+        if cache_path:
+            session = requests_cache.CachedSession(str(cache_path), backend='sqlite',
+                                                   expire_after=HTTP_CACHE_EXPIRE_AFTER)
+        else:
+            session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE,
+                              max_retries=Retry(total=3, backoff_factor=0.3,
+                                                status_forcelist=[502, 503, 504],
+                                                raise_on_status=False))
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    @staticmethod
+    def _validate_config_content(config_dto: ConfigDTO) -> None:
         """
         Ensure configuration parameters
         are not corrupt
         """
-        config_dto = self._extract_config_content()
-
         if not isinstance(config_dto.seed_urls, list):
             raise IncorrectSeedURLError
 
         for url in config_dto.seed_urls:
-            if not isinstance(url, str) or not re.match(r'https?://.*/', url):
+            if (not isinstance(url, str) or not url.startswith(SEED_URL_PREFIXES)
+                    or '/' not in url.partition('://')[2]):
                 raise IncorrectSeedURLError
 
         if (not isinstance(config_dto.total_articles, int)
@@ -176,15 +231,39 @@ class Config:
         """
         return self._headless_mode
 
+    def get_session(self) -> requests.Session:
+        """
+        Retrieve session to use during requesting
+        """
+        return self._session
+
+    def get_request_kwargs(self) -> dict[str, Any]:
+        """
+        Retrieve keyword arguments to use during requesting
+        """
+        return self._request_kwargs
+
 
 def make_request(url: str, config: Config) -> requests.models.Response:
     """
     Delivers a response from a request
     with given configuration
     """
-    response = requests.get(url, headers=config.get_headers(), timeout=config.get_timeout(),
-                            verify=config.get_verify_certificate())
-    response.encoding = response.apparent_encoding
+    response = config.get_session().get(url, **config.get_request_kwargs())
+    if 'charset' not in response.headers.get('content-type', '').lower():
+        response.encoding = config.get_encoding() or response.apparent_encoding
+    return response
+
+
+def fetch_page(url: str, config: Config) -> Optional[requests.models.Response]:
+    """
+    Delivers a successful response for a page, None if it is not available
+    """
+    response = make_request(url=url, config=config)
+    try:
+        response.raise_for_status()
+    except requests.exceptions.HTTPError:
+        return None
     return response
 
 
@@ -199,12 +278,26 @@ class Crawler:
         self.config = config
         self.urls = []
 
-    def _extract_url(self, article_bs: BeautifulSoup) -> str:
+    def _extract_url(self, article_tag: str) -> str:
         """
         Finds and retrieves URL from HTML
         """
         base = str(self.get_search_urls()[0])
-        return urllib.parse.urljoin(base, str(article_bs.get('href')))
+        href = HREF_PATTERN.search(article_tag)
+        return urllib.parse.urljoin(base, unescape(href.group(1))) if href else ''
+
+    def _find_page_articles(self, page_url: str) -> list[str]:
+        """
+        Finds articles on a single page
+        """
+        try:
+            response = make_request(url=page_url, config=self.config)
+            response.raise_for_status()
+        except requests.exceptions.HTTPError:
+            return []
+        news = (self._extract_url(article_tag=tag.group())
+                for tag in CARD_PATTERN.finditer(response.text))
+        return [url for url in news if url]
 
     def find_articles(self) -> None:
         """
@@ -213,24 +306,16 @@ class Crawler:
         article_items = []
         seed_url = self.get_search_urls()[0]
         number = 1
-        while len(article_items) < self.config.get_num_articles():
-            url = urllib.parse.urljoin(seed_url, '?type=article&PAGEN_1='+str(number))
-            try:
-                response = make_request(url=url, config=self.config)
-                response.raise_for_status()
-            except requests.exceptions.HTTPError:
-                continue
-            soup = BeautifulSoup(response.text, 'html.parser')
-            news = soup.find_all('a', {'class': 'card', 'href': True})
-            for article in news:
-                article_url = self._extract_url(article_bs=article)
-                try:
-                    response = make_request(url=article_url, config=self.config)
-                    response.raise_for_status()
-                except requests.exceptions.HTTPError:
-                    continue
-                article_items.append(article_url)
-            number += 1
+        with ThreadPoolExecutor(max_workers=PAGES_PER_BATCH) as executor:
+            while len(article_items) < self.config.get_num_articles():
+                urls = [f"{seed_url}?{urllib.parse.urlencode({'type': 'article', 'PAGEN_1': page})}"
+                        for page in range(number, number + PAGES_PER_BATCH)]
+                found = len(article_items)
+                for page_articles in executor.map(self._find_page_articles, urls):
+                    article_items.extend(page_articles)
+                if len(article_items) == found:
+                    break
+                number += PAGES_PER_BATCH
         self.urls.extend(article_items[:self.config.get_num_articles()])
 
     def get_search_urls(self) -> list:
@@ -253,50 +338,55 @@ class HTMLParser:
         self.config = config
         self.article = Article(url=self.full_url, article_id=self.article_id)
 
-    def _fill_article_with_text(self, article_soup: BeautifulSoup) -> None:
+    def _fill_article_with_text(self, article_tree: html.HtmlElement) -> None:
         """
         Finds text of article
         """
-        paragraphs_body = article_soup.find_all('p')
-        text_body = ''.join(i.text.strip() for i in paragraphs_body)
+        paragraphs_body = PARAGRAPHS_XPATH(article_tree)
+        text_body = ''.join(i.text_content().strip() for i in paragraphs_body)
         self.article.text = text_body
 
-    def _fill_article_with_meta_information(self, article_soup: BeautifulSoup) -> None:
+    def _fill_article_with_meta_information(self, article_tree: html.HtmlElement) -> None:
         """
         Finds meta information of article
         """
-        title = article_soup.find('h1', {'class':'material__name'})
-        if title:
-            self.article.title = title.text.strip()
-        authors = article_soup.find('span', {'class': 'material__autor'})
-        if authors:
-            self.article.author = [authors.text.strip()]
-        else:
-            self.article.author = ['NOT FOUND']
-        date = article_soup.find('span', {'itemprop':'datePublished'})
-        self.article.date = self.unify_date_format(date_str=str(date.text))
-        tags_list = []
-        hashtags = article_soup.find('div', {'class':'hashtags'})
-        if hashtags:
-            tags = hashtags.find_all('a')
-            for tag in tags:
-                tags_list.append(tag.text.strip())
-            self.article.topics = tags_list
+        self.article.title = TITLE_XPATH(article_tree).strip()
+        author = AUTHOR_XPATH(article_tree).strip()
+        self.article.author = [author] if author else ['NOT FOUND']
+        self.article.date = self.unify_date_format(date_str=DATE_XPATH(article_tree))
+        self.article.topics = [tag.text_content().strip() for tag in TOPICS_XPATH(article_tree)]
 
     def unify_date_format(self, date_str: str) -> datetime.datetime:
         """
         Unifies date format
         """
-        return datetime.datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%S+03:00')
+        try:
+            date = ciso8601.parse_datetime(date_str)
+        except ValueError:
+            date = None
+        if date is None or date.tzinfo is None:
+            return datetime.datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%S+03:00')
+        return date.astimezone(SITE_TIMEZONE).replace(tzinfo=None)
 
     def parse(self) -> Union[Article, bool, list]:
         """
         Parses each article
         """
-        response = make_request(url=self.full_url, config=self.config)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        self._fill_article_with_text(article_soup=soup)
-        self._fill_article_with_meta_information(article_soup=soup)
+        response = fetch_page(url=self.full_url, config=self.config)
+        if response is None:
+            return False
+        return self.parse_page(page=response.content, encoding=response.encoding)
+
+    def parse_page(self, page: bytes, encoding: Optional[str] = None) -> Union[Article, bool]:
+        """
+        Parses already fetched HTML of article
+        """
+        try:
+            article_tree = html.fromstring(page, parser=html.HTMLParser(encoding=encoding))
+        except etree.ParserError:
+            return False
+        self._fill_article_with_text(article_tree=article_tree)
+        self._fill_article_with_meta_information(article_tree=article_tree)
         return self.article
 
 
@@ -307,24 +397,83 @@ def prepare_environment(base_path: Union[Path, str]) -> None:
     path_for_environment = Path(base_path)
 
     if path_for_environment.exists():
-        shutil.rmtree(path_for_environment)
+        trash_path = Path(tempfile.mkdtemp(prefix=f'.{path_for_environment.name}-',
+                                           dir=path_for_environment.parent))
+        path_for_environment.rename(trash_path / path_for_environment.name)
+        threading.Thread(target=shutil.rmtree, args=(trash_path,),
+                         kwargs={'ignore_errors': True}).start()
     path_for_environment.mkdir(parents=True)
 
 
+def init_parser_worker(path_to_config: Path) -> None:
+    """
+    Loads configuration once per parser worker process
+    """
+    PARSER_WORKER_STATE['config'] = Config(path_to_config)
+
+
+def parse_article(full_url: str, article_id: int,
+                  page: bytes, encoding: Optional[str]) -> Union[Article, bool]:
+    """
+    Parses already fetched HTML of article in a worker process
+    """
+    parser = HTMLParser(full_url=full_url, article_id=article_id,
+                        config=PARSER_WORKER_STATE['config'])
+    return parser.parse_page(page=page, encoding=encoding)
+
+
+def save_article(article: Article) -> None:
+    """
+    Saves raw text and meta information of article
+    """
+    to_raw(article)
+    to_meta(article)
+
+
+def save_parsed_article(parsed: Future, article_ids: Iterator[int]) -> None:
+    """
+    Saves article parsed in a worker process under the next free id
+    """
+    article = parsed.result()
+    if isinstance(article, Article):
+        article.article_id = next(article_ids)
+        save_article(article)
+
+
+def collect_articles(urls: list[str], config: Config) -> None:
+    """
+    Fetches, parses and saves articles concurrently
+    """
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as fetcher, \
+            ProcessPoolExecutor(initializer=init_parser_worker,
+                                initargs=(config.path_to_config,)) as parser_pool, \
+            ThreadPoolExecutor(max_workers=1) as writer:
+        responses = fetcher.map(partial(fetch_page, config=config), urls)
+        fetched = ((url, response) for url, response in zip(urls, responses)
+                   if response is not None)
+        article_ids = itertools.count(start=1)
+        saved = []
+        for i, (url, response) in enumerate(fetched, start=1):
+            article = parser_pool.submit(parse_article, url, i,
+                                         response.content, response.encoding)
+            saved.append(writer.submit(save_parsed_article, article, article_ids))
+    for future in saved:
+        future.result()
+
+
 def main() -> None:
     """
     Entrypoint for scrapper module
     """
-    config = Config(CRAWLER_CONFIG_PATH)
+    arg_parser = argparse.ArgumentParser(description='Collects articles into ASSETS_PATH')
+    arg_parser.add_argument('--cache', action='store_true',
+                            help='cache fetched pages on disk between runs')
+    args = arg_parser.parse_args()
+    config = Config(CRAWLER_CONFIG_PATH, cache_path=HTTP_CACHE_PATH if args.cache else None)
     prepare_environment(ASSETS_PATH)
     crawler = Crawler(config=config)
     crawler.find_articles()
-    for i, url in enumerate(crawler.urls, start=1):
-        parser = HTMLParser(full_url=url, article_id=i, config=config)
-        article = parser.parse()
-        if isinstance(article, Article):
-            to_raw(article)
-            to_meta(article)
+    collect_articles(urls=crawler.urls, config=config)
 
 
 if __name__ == "__main__":